@@ -0,0 +1,468 @@
+#Botmation Terms of use
+#This code is for personal entertainment use only.
+#This code is not to be used commercially.
+
+"""Audio device xrun telemetry and adaptive block sizing."""
+
+import collections
+import json
+import logging
+import os
+import random
+import tempfile
+
+import click
+
+try:
+    from . import audio_helpers
+except (SystemError, ImportError):
+    import audio_helpers
+
+
+DEFAULT_BLOCK_SIZES = (1600, 3200, 6400, 12800, 25600)
+DEFAULT_ITER_SIZES = (1600, 3200, 6400)
+DEFAULT_PROBE_SECONDS = 2.0
+DEFAULT_STEP_UP_TURNS = 3
+DEFAULT_STEP_UP_WINDOW = 5
+DEFAULT_STEP_DOWN_TURNS = 50
+
+
+AudioProfile = collections.namedtuple('AudioProfile',
+                                      ['block_size', 'iter_size'])
+
+
+class StreamStats(object):
+    """Xrun and queue depth counters of an audio stream.
+
+    The output side of a duplex stream runs dry while recording, so the
+    underflow of the first write after reads is counted apart in
+    playback_start_underflows and not as an xrun.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.reads = 0
+        self.writes = 0
+        self.overflows = 0
+        self.underflows = 0
+        self.playback_start_underflows = 0
+        self.max_read_queue = 0
+        self.max_write_queue = 0
+        self._total_read_queue = 0
+        self._writing = False
+
+    @property
+    def xruns(self):
+        return self.overflows + self.underflows
+
+    @property
+    def xrun_rate(self):
+        """Xruns per read or write, comparable across iter sizes."""
+        if not self.reads + self.writes:
+            return 0.0
+        return self.xruns / float(self.reads + self.writes)
+
+    @property
+    def mean_read_queue(self):
+        if not self.reads:
+            return 0.0
+        return self._total_read_queue / float(self.reads)
+
+    def record_read(self, queue, overflow):
+        self.reads += 1
+        self._writing = False
+        self._total_read_queue += queue
+        self.max_read_queue = max(self.max_read_queue, queue)
+        if overflow:
+            self.overflows += 1
+
+    def record_write(self, queue, underflow):
+        self.writes += 1
+        self.max_write_queue = max(self.max_write_queue, queue)
+        if underflow and not self._writing:
+            self.playback_start_underflows += 1
+        elif underflow:
+            self.underflows += 1
+        self._writing = True
+
+    def __str__(self):
+        return ('reads=%d overflows=%d writes=%d underflows=%d '
+                '(+%d at playback start) '
+                'read queue mean=%.0f max=%d write queue max=%d' % (
+                    self.reads, self.overflows, self.writes,
+                    self.underflows, self.playback_start_underflows,
+                    self.mean_read_queue, self.max_read_queue,
+                    self.max_write_queue))
+
+
+class MonitoredSoundDeviceStream(audio_helpers.SoundDeviceStream):
+    """SoundDeviceStream that counts xruns and queue depths.
+
+    Queue depths are the frames available in the device buffer
+    before each read and write.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(MonitoredSoundDeviceStream, self).__init__(*args, **kwargs)
+        self.stats = StreamStats()
+
+    def read(self, size):
+        queue = self._audio_stream.read_available
+        buf, overflow = self._audio_stream.read(size)
+        self.stats.record_read(queue, overflow)
+        if overflow:
+            logging.warning('SoundDeviceStream read overflow (%d, %d)',
+                            size, len(buf))
+        return bytes(buf)
+
+    def write(self, buf):
+        queue = self._audio_stream.write_available
+        underflow = self._audio_stream.write(buf)
+        self.stats.record_write(queue, underflow)
+        if underflow:
+            logging.warning('SoundDeviceStream write underflow (size: %d)',
+                            len(buf))
+        return len(buf)
+
+
+class SimulatedSoundDeviceStream(object):
+    """Simulated audio device for exercising the tuner without hardware.
+
+    Each read and write is delayed by the device latency plus a random
+    scheduling jitter; an xrun happens when that delay exceeds the time
+    covered by one block. Like a duplex SoundDeviceStream, the first
+    write after reads underflows. Audio is silence and no real time
+    passes.
+
+    Args:
+      sample_rate: sample rate in hertz.
+      sample_width: size of a single sample in bytes.
+      block_size: block size in bytes of the simulated device buffer.
+      flush_size: accepted for SoundDeviceStream compatibility.
+      device_latency: fixed latency of the simulated device in seconds.
+      jitter: maximum scheduling jitter in seconds.
+      seed: seed of the jitter generator.
+    """
+
+    def __init__(self, sample_rate, sample_width, block_size, flush_size=0,
+                 device_latency=0.05, jitter=0.1, seed=0):
+        self._sample_rate = sample_rate
+        self._sample_width = sample_width
+        self._block_size = block_size
+        self._flush_size = flush_size
+        self.device_latency = device_latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self.stats = StreamStats()
+
+    def _delay(self):
+        """Returns: (queued frames, True on xrun) of the next operation."""
+        bytes_per_sec = self._sample_rate * self._sample_width
+        block_sec = self._block_size / float(bytes_per_sec)
+        delay = self.device_latency + self._random.random() * self.jitter
+        queue = int(min(delay, block_sec) * self._sample_rate)
+        return queue, delay > block_sec
+
+    def read(self, size):
+        queue, overflow = self._delay()
+        self.stats.record_read(queue, overflow)
+        return b'\x00' * size
+
+    def write(self, buf):
+        queue, underflow = self._delay()
+        if not self.stats._writing:
+            underflow = True
+        self.stats.record_write(queue, underflow)
+        return len(buf)
+
+    def flush(self):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+
+class ProfileStore(object):
+    """JSON file of the tuned AudioProfile of each audio device.
+
+    Args:
+      path: path of the JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def get(self, device_name):
+        profile = self._load().get(device_name)
+        if profile is None:
+            return None
+        return AudioProfile(**profile)
+
+    def put(self, device_name, profile):
+        profiles = self._load()
+        profiles[device_name] = profile._asdict()
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(profiles, f, indent=2, sort_keys=True)
+
+
+def default_device_name():
+    """Returns: name of the default input/output sound device pair."""
+    import sounddevice as sd
+    return '%s|%s' % (sd.query_devices(kind='input')['name'],
+                      sd.query_devices(kind='output')['name'])
+
+
+class AutoTuner(object):
+    """Searches the lowest latency audio profile without xruns.
+
+    At startup every candidate profile is probed from the lowest
+    latency up, and the first one without xruns is kept. While running,
+    observe() moves to the next larger block size when step_up_turns of
+    the last step_up_window turns had xruns, and back to the next
+    smaller one after step_down_turns clean turns in a row.
+    The chosen profile is saved per device.
+
+    Args:
+      stream_factory: callable(block_size) returning a stream with
+        a stats attribute, e.g. MonitoredSoundDeviceStream.
+      sample_rate: sample rate in hertz.
+      sample_width: size of a single sample in bytes.
+      store: ProfileStore used to restore and save profiles.
+      device_name: key of the device in the store.
+      block_sizes: candidate device block sizes in bytes.
+      iter_sizes: candidate stream iteration sizes in bytes.
+      probe_seconds: audio duration read and written per candidate.
+      step_up_turns: turns with xruns that make the block size grow.
+      step_up_window: recent turns looked at for step_up_turns.
+      step_down_turns: clean turns in a row that make it shrink.
+    """
+
+    def __init__(self, stream_factory, sample_rate, sample_width,
+                 store=None, device_name='default',
+                 block_sizes=DEFAULT_BLOCK_SIZES,
+                 iter_sizes=DEFAULT_ITER_SIZES,
+                 probe_seconds=DEFAULT_PROBE_SECONDS,
+                 step_up_turns=DEFAULT_STEP_UP_TURNS,
+                 step_up_window=DEFAULT_STEP_UP_WINDOW,
+                 step_down_turns=DEFAULT_STEP_DOWN_TURNS):
+        self.stream_factory = stream_factory
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.store = store
+        self.device_name = device_name
+        self.probe_seconds = probe_seconds
+        self.candidates = sorted(
+            (AudioProfile(b, i) for b in block_sizes for i in iter_sizes),
+            key=self.latency)
+        self.step_up_turns = step_up_turns
+        self.step_down_turns = step_down_turns
+        self.profile = None
+        self._recent = collections.deque(maxlen=step_up_window)
+        self._clean_turns = 0
+
+    def latency(self, profile):
+        """Returns: buffering latency of the profile in seconds."""
+        return ((profile.block_size + profile.iter_size) /
+                float(self.sample_rate * self.sample_width))
+
+    def probe(self, profile):
+        """Returns: StreamStats of a capture and playback run."""
+        stream = self.stream_factory(profile.block_size)
+        chunks = int(self.probe_seconds * self.sample_rate *
+                     self.sample_width / profile.iter_size) or 1
+        try:
+            stream.start()
+            for _ in range(chunks):
+                stream.read(profile.iter_size)
+            for _ in range(chunks):
+                stream.write(b'\x00' * profile.iter_size)
+            stream.stop()
+        finally:
+            stream.close()
+        return stream.stats
+
+    def tune(self):
+        """Returns: the lowest latency profile without xruns, or if all
+          of them had some, the one with the fewest xruns per operation,
+          ties going to the larger block size.
+        """
+        best, best_key = None, None
+        for profile in self.candidates:
+            stats = self.probe(profile)
+            logging.info('Audio profile %s (%.0fms): %s', profile,
+                         1000 * self.latency(profile), stats)
+            if not stats.xruns:
+                return profile
+            key = (stats.xrun_rate, -profile.block_size)
+            if best_key is None or key < best_key:
+                best, best_key = profile, key
+        return best
+
+    def _save(self):
+        if self.store:
+            self.store.put(self.device_name, self.profile)
+
+    def load_or_tune(self):
+        """Returns: the saved profile of the device, tuned if missing."""
+        if self.store:
+            self.profile = self.store.get(self.device_name)
+        if self.profile is None:
+            self.profile = self.tune()
+            self._save()
+        logging.info('Using audio profile %s for %s', self.profile,
+                     self.device_name)
+        return self.profile
+
+    def _step(self, direction):
+        """Moves to the next block size in direction, keeping the iter
+        size when possible.
+
+        Returns: True if the profile changed.
+        """
+        self._recent.clear()
+        self._clean_turns = 0
+        blocks = sorted(set(p.block_size for p in self.candidates))
+        if direction > 0:
+            blocks = [b for b in blocks if b > self.profile.block_size]
+        else:
+            blocks = [b for b in reversed(blocks)
+                      if b < self.profile.block_size]
+        if not blocks:
+            return False
+        profiles = [p for p in self.candidates if p.block_size == blocks[0]]
+        same_iter = [p for p in profiles
+                     if p.iter_size == self.profile.iter_size]
+        self.profile = (same_iter or profiles)[0]
+        self._save()
+        return True
+
+    def observe(self, stats):
+        """Adapts the profile to the xruns of a finished turn.
+
+        Returns: True if the profile changed.
+        """
+        self._recent.append(bool(stats.xruns))
+        if stats.xruns:
+            self._clean_turns = 0
+            if sum(self._recent) < self.step_up_turns:
+                return False
+            turns = len(self._recent)
+            if self._step(1):
+                logging.warning('xruns in %d of %d turns, switching to '
+                                'audio profile %s', self.step_up_turns,
+                                turns, self.profile)
+                return True
+            return False
+        self._clean_turns += 1
+        if self._clean_turns < self.step_down_turns:
+            return False
+        if self._step(-1):
+            logging.info('%d turns without xruns, switching to audio '
+                         'profile %s', self.step_down_turns, self.profile)
+            return True
+        return False
+
+
+def _check(condition, message, *args):
+    if not condition:
+        raise click.ClickException(message % args)
+
+
+@click.command()
+@click.option('--device-latency', default=0.15, show_default=True,
+              help='Latency of the simulated device in seconds.')
+@click.option('--jitter', default=0.1, show_default=True,
+              help='Scheduling jitter of the simulated device in seconds.')
+@click.option('--sample-rate', default=audio_helpers.DEFAULT_AUDIO_SAMPLE_RATE,
+              show_default=True, help='Audio sample rate in hertz.')
+@click.option('--verbose', '-v', is_flag=True, default=False,
+              help='Verbose logging.')
+def main(device_latency, jitter, sample_rate, verbose):
+    """Runs the auto tuner against a simulated audio device and checks
+    the chosen profile, the saved JSON and the runtime adaptation.
+    """
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+    sample_width = 2
+
+    def factory(block_size):
+        return SimulatedSoundDeviceStream(sample_rate, sample_width,
+                                          block_size,
+                                          device_latency=device_latency,
+                                          jitter=jitter)
+    path = os.path.join(tempfile.mkdtemp(), 'audio_profiles.json')
+    tuner = AutoTuner(factory, sample_rate, sample_width,
+                      store=ProfileStore(path), device_name='simulated')
+    tuned = tuner.load_or_tune()
+
+    # The simulated device is seeded, probing again gives the same stats.
+    index = tuner.candidates.index(tuned)
+    tuned_stats = tuner.probe(tuned)
+    if tuned_stats.xruns:
+        for profile in tuner.candidates:
+            stats = tuner.probe(profile)
+            _check(stats.xruns, '%s has no xruns but %s was kept',
+                   profile, tuned)
+            _check((stats.xrun_rate, -profile.block_size) >=
+                   (tuned_stats.xrun_rate, -tuned.block_size),
+                   '%s has fewer xruns per operation than %s',
+                   profile, tuned)
+    for profile in tuner.candidates[:index]:
+        _check(tuner.probe(profile).xruns,
+               '%s has no xruns but is faster than %s', profile, tuned)
+    with open(path) as f:
+        saved = json.load(f)
+    _check(saved == {'simulated': tuned._asdict()},
+           'saved profiles %s, expected %s', saved, tuned)
+    click.echo('tuned: %s (%.0fms), saved to %s' %
+               (tuned, 1000 * tuner.latency(tuned), path))
+
+    if tuned.block_size == max(p.block_size for p in tuner.candidates):
+        click.echo('OK, largest block size, runtime adaptation not checked')
+        return
+
+    xruns, clean = StreamStats(), StreamStats()
+    xruns.overflows = 1
+    for _ in range(tuner.step_up_turns - 1):
+        _check(not tuner.observe(xruns), 'stepped up before threshold')
+        tuner.observe(clean)
+    _check(tuner.observe(xruns), 'did not step up after %d xrun turns',
+           tuner.step_up_turns)
+    _check(tuner.profile.block_size > tuned.block_size,
+           '%s is not larger than %s', tuner.profile, tuned)
+    _check(ProfileStore(path).get('simulated') == tuner.profile,
+           'stepped up profile not saved')
+    click.echo('stepped up: %s' % (tuner.profile,))
+    for _ in range(tuner.step_down_turns - 1):
+        _check(not tuner.observe(clean), 'stepped down before threshold')
+    _check(tuner.observe(clean), 'did not step down after %d clean turns',
+           tuner.step_down_turns)
+    _check(tuner.profile == tuned, 'stepped down to %s, expected %s',
+           tuner.profile, tuned)
+    click.echo('stepped down: %s' % (tuner.profile,))
+    click.echo('OK')
+
+
+if __name__ == '__main__':
+    main()
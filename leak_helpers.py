@@ -0,0 +1,150 @@
+#Botmation Terms of use
+#This code is for personal entertainment use only.
+#This code is not to be used commercially.
+
+"""Long-run memory and resource leak checks."""
+
+import collections
+import gc
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+
+
+DEFAULT_TOP_SITES = 10
+DEFAULT_TRACEBACK_FRAMES = 5
+
+_NUMBERS = re.compile(r'\d+')
+
+
+def count_fds():
+    """Returns: number of open file descriptors, None if unknown."""
+    for path in ('/proc/self/fd', '/dev/fd'):
+        if os.path.isdir(path):
+            return len(os.listdir(path))
+    return None
+
+
+def count_threads():
+    """Returns: Counter of live threads by name, numbers stripped."""
+    return collections.Counter(_NUMBERS.sub('N', t.name)
+                               for t in threading.enumerate())
+
+
+def count_instances(types):
+    """Returns: Counter of live instances of types by class name."""
+    gc.collect()
+    # type() rather than isinstance(), which fails on dead weak proxies.
+    live_types = map(type, gc.get_objects())
+    return collections.Counter(t.__name__ for t in live_types
+                               if issubclass(t, types))
+
+
+class LeakChecker(object):
+    """Snapshots memory and resources every N turns and reports growth.
+
+    The baseline is taken after the first turn, once caches are warm.
+    Each checkpoint appends to the report the thread, file descriptor
+    and tracked instance counts and the allocation sites that grew most
+    since the baseline.
+
+    Args:
+      every: turns between checkpoints.
+      report_path: path of the text report.
+      types: classes whose live instances are counted, e.g. audio streams.
+      top: allocation sites reported per checkpoint.
+    """
+
+    def __init__(self, every, report_path, types=(), top=DEFAULT_TOP_SITES):
+        self.every = every
+        self.report_path = report_path
+        self.types = tuple(types)
+        self.top = top
+        self.turns = 0
+        self._baseline = None
+        self._previous = None
+        self._start = None
+
+    def start(self):
+        tracemalloc.start(DEFAULT_TRACEBACK_FRAMES)
+        self._start = time.monotonic()
+        with open(self.report_path, 'w') as f:
+            f.write('Leak check every %d turns, started %s\n' %
+                    (self.every, time.strftime('%Y-%m-%d %H:%M:%S')))
+
+    def stop(self):
+        if self._baseline and self.turns % self.every:
+            self.check()
+        tracemalloc.stop()
+        logging.info('Leak report written to %s', self.report_path)
+
+    def turn(self, *args):
+        """Counts a finished turn, usable as an engine event callback."""
+        self.turns += 1
+        if self._baseline is None:
+            self._baseline = self._snapshot()
+            self._previous = self._resources()
+        elif self.turns % self.every == 0:
+            self.check()
+
+    def _snapshot(self):
+        # The checker's own bookkeeping, e.g. earlier snapshots and the
+        # fnmatch cache of these filters, is not growth of the engine.
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__, all_frames=True),
+            tracemalloc.Filter(False, __file__, all_frames=True),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def _resources(self):
+        return {
+            'threads': count_threads(),
+            'fds': count_fds(),
+            'instances': count_instances(self.types) if self.types
+                         else collections.Counter(),
+        }
+
+    def check(self):
+        """Appends a checkpoint to the report.
+
+        Returns: list of the StatisticDiff that grew most since the
+          baseline.
+        """
+        resources = self._resources()
+        growth = [s for s in self._snapshot().compare_to(self._baseline,
+                                                         'lineno')
+                  if s.size_diff > 0][:self.top]
+        current, peak = tracemalloc.get_traced_memory()
+        previous, self._previous = self._previous, resources
+
+        lines = ['',
+                 '== turn %d, %.1fs ==' % (self.turns,
+                                           time.monotonic() - self._start),
+                 'traced memory: %.1f KiB (peak %.1f KiB)' % (
+                     current / 1024.0, peak / 1024.0),
+                 'threads: %d (%+d)' % (
+                     sum(resources['threads'].values()),
+                     sum(resources['threads'].values()) -
+                     sum(previous['threads'].values()))]
+        for name, count in sorted(resources['threads'].items()):
+            lines.append('  %s: %d' % (name, count))
+        if resources['fds'] is not None:
+            lines.append('file descriptors: %d (%+d)' % (
+                resources['fds'], resources['fds'] - (previous['fds'] or 0)))
+        for name, count in sorted(resources['instances'].items()):
+            lines.append('%s instances: %d (%+d)' % (
+                name, count, count - previous['instances'][name]))
+        lines.append('top growth since baseline:')
+        for stat in growth:
+            lines.append('  %+.1f KiB %+d blocks %s' % (
+                stat.size_diff / 1024.0, stat.count_diff, stat.traceback))
+        with open(self.report_path, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+        logging.info('Leak check at turn %d: %.1f KiB traced, %d threads',
+                     self.turns, current / 1024.0,
+                     sum(resources['threads'].values()))
+        return growth
@@ -0,0 +1,344 @@
+#Botmation Terms of use
+#This code is for personal entertainment use only.
+#This code is not to be used commercially.
+
+"""Noise suppression of captured audio before recognition and upload."""
+
+import glob
+import logging
+import os.path
+import time
+
+import click
+import numpy as np
+import speech_recognition as sr
+
+try:
+    from . import recognizer_helpers
+except (SystemError, ImportError):
+    import recognizer_helpers
+
+
+DEFAULT_FRAME_SECONDS = 0.032
+DEFAULT_HIGHPASS_HZ = 100
+# CPU seconds spent per second of processed audio, 5% of one core.
+DEFAULT_CPU_BUDGET = 0.05
+SYNTHETIC_SNRS = (0, 5, 10)
+SYNTHETIC_NOISES = ('white', 'hum')
+
+
+class NoiseSuppressor(object):
+    """Streaming Wiener filter with a learned noise profile,
+    high-pass filter and automatic gain control.
+
+    Audio is processed as LINEAR16 bytes in half overlapping FFT frames,
+    all frames of a capture block at once, and comes out delayed by half
+    a frame. The noise profile is learned from the first frames and then
+    follows the frames quiet enough to be noise.
+
+    Args:
+      sample_rate: sample rate in hertz.
+      frame_size: FFT frame size in samples, about 32ms if missing.
+      highpass_hz: frequencies below are removed.
+      noise_frames: frames used to learn the initial noise profile.
+      noise_update: smoothing factor of noise profile updates.
+      speech_ratio: frames louder than this times the noise are speech.
+      over_subtraction: noise estimate multiplier of the Wiener filter.
+      gain_floor: lowest Wiener gain, limits musical noise.
+      agc_target: target RMS level of speech in full scale.
+      agc_max_gain: highest AGC gain.
+      agc_smoothing: smoothing factor of AGC gain updates.
+      cpu_budget: CPU seconds allowed per second of audio, exceeding it
+        is logged once.
+    """
+
+    def __init__(self, sample_rate, frame_size=None,
+                 highpass_hz=DEFAULT_HIGHPASS_HZ, noise_frames=10,
+                 noise_update=0.05, speech_ratio=3.0, over_subtraction=1.5,
+                 gain_floor=0.1, agc_target=0.1, agc_max_gain=10.0,
+                 agc_smoothing=0.2, cpu_budget=DEFAULT_CPU_BUDGET):
+        self.sample_rate = sample_rate
+        if frame_size is None:
+            frame_size = 1 << int(np.ceil(np.log2(
+                DEFAULT_FRAME_SECONDS * sample_rate)))
+        self.frame_size = frame_size
+        self.hop = frame_size // 2
+        self.noise_frames = noise_frames
+        self.noise_update = noise_update
+        self.speech_ratio = speech_ratio
+        self.over_subtraction = over_subtraction
+        self.gain_floor = gain_floor
+        self.agc_target = agc_target
+        self.agc_max_gain = agc_max_gain
+        self.agc_smoothing = agc_smoothing
+        self.cpu_budget = cpu_budget
+
+        # Square root of a periodic Hann window on analysis and synthesis
+        # sums to one at half overlap.
+        self._window = np.sqrt(np.hanning(frame_size + 1)[:-1]).astype(
+            np.float32)
+        freqs = np.fft.rfftfreq(frame_size, 1.0 / sample_rate)
+        self._highpass = (freqs >= highpass_hz).astype(np.float32)
+
+        self.noise = None
+        self._noise_sum = 0
+        self._noise_count = 0
+        self._agc_gain = 1.0
+        self.cpu_time = 0.0
+        self.audio_time = 0.0
+        self._warned = False
+        self.reset()
+
+    def reset(self):
+        """Drops buffered audio, keeps the noise profile and AGC gain."""
+        self._buffer = np.zeros(self.hop, dtype=np.float32)
+        self._tail = np.zeros(self.hop, dtype=np.float32)
+
+    @property
+    def cpu_load(self):
+        """CPU seconds spent per second of processed audio."""
+        if not self.audio_time:
+            return 0.0
+        return self.cpu_time / self.audio_time
+
+    def _update_noise(self, power):
+        """Returns: mask of the speech frames, None while learning."""
+        if self.noise is None:
+            power = power[:self.noise_frames - self._noise_count]
+            self._noise_sum = self._noise_sum + power.sum(axis=0)
+            self._noise_count += len(power)
+            if self._noise_count >= self.noise_frames:
+                self.noise = self._noise_sum / self._noise_count
+                logging.debug('Learned noise profile from %d frames',
+                              self._noise_count)
+            return None
+        quiet = power.mean(axis=1) < self.speech_ratio * self.noise.mean()
+        if quiet.any():
+            self.noise += self.noise_update * (
+                power[quiet].mean(axis=0) - self.noise)
+        return ~quiet
+
+    def _wiener_gain(self, power):
+        if self.noise is None:
+            return self._highpass
+        snr = np.maximum(
+            power / (self.over_subtraction * self.noise + 1e-12) - 1, 0)
+        return np.maximum(snr / (1 + snr), self.gain_floor) * self._highpass
+
+    def _agc(self, samples, speech):
+        gain = self._agc_gain
+        # Only speech moves the gain, silence would be boosted to noise.
+        if speech is not None and speech.any():
+            blocks = samples.reshape(len(speech), -1)[speech]
+            rms = np.sqrt(np.mean(blocks ** 2)) + 1e-9
+            target = min(self.agc_target / rms, self.agc_max_gain)
+            gain += self.agc_smoothing * (target - gain)
+        ramp = np.linspace(self._agc_gain, gain, len(samples),
+                           dtype=np.float32)
+        self._agc_gain = gain
+        return samples * ramp
+
+    def process(self, data):
+        """Filters LINEAR16 audio.
+
+        Returns: the filtered audio available so far, as LINEAR16 bytes.
+        """
+        start = time.thread_time()
+        samples = np.frombuffer(data, dtype='<i2').astype(np.float32)
+        buf = np.concatenate((self._buffer, samples / 32768))
+        count = (len(buf) - self.hop) // self.hop
+        if count <= 0:
+            self._buffer = buf
+            return b''
+        index = (np.arange(self.frame_size)[None, :] +
+                 self.hop * np.arange(count)[:, None])
+        frames = buf[index] * self._window
+        self._buffer = buf[count * self.hop:]
+
+        spectrum = np.fft.rfft(frames, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        speech = self._update_noise(power)
+        out = np.fft.irfft(spectrum * self._wiener_gain(power),
+                           n=self.frame_size, axis=1) * self._window
+
+        # Overlap-add each frame head onto the previous frame tail.
+        tails = np.vstack((self._tail[None, :], out[:-1, self.hop:]))
+        self._tail = out[-1, self.hop:]
+        filtered = self._agc((out[:, :self.hop] + tails).ravel(), speech)
+        result = (np.clip(filtered, -1, 1) * 32767).astype('<i2').tobytes()
+
+        self.cpu_time += time.thread_time() - start
+        self.audio_time += len(samples) / float(self.sample_rate)
+        if (not self._warned and self.audio_time >= 10 and
+                self.cpu_load > self.cpu_budget):
+            logging.warning('Noise suppression uses %.1f%% CPU, '
+                            'over its %.1f%% budget', 100 * self.cpu_load,
+                            100 * self.cpu_budget)
+            self._warned = True
+        return result
+
+    def process_audio_data(self, audio):
+        """Returns: a filtered copy of a speech_recognition.AudioData."""
+        if audio.sample_rate != self.sample_rate:
+            raise ValueError('Audio sample rate %d, expected %d' %
+                             (audio.sample_rate, self.sample_rate))
+        if audio.sample_width != 2:
+            return audio
+        self.reset()
+        delay = 2 * self.hop
+        filtered = (self.process(audio.frame_data) +
+                    self.process(b'\x00' * 2 * self.frame_size))
+        self.reset()
+        return type(audio)(filtered[delay:delay + len(audio.frame_data)],
+                           audio.sample_rate, audio.sample_width)
+
+
+def evaluate(recognizer, fixtures, suppress=False):
+    """Recognizes WAV fixtures and compares with the expected hotwords.
+
+    Args:
+      recognizer: RacingRecognizer used for recognition.
+      fixtures: list of (WAV path, expected hotword) pairs.
+      suppress: apply a NoiseSuppressor before recognition.
+    Returns: (accuracy, re-ask rate, noise suppression CPU load).
+    """
+    correct = reask = 0
+    suppressors = {}
+    for path, expected in fixtures:
+        with sr.AudioFile(path) as source:
+            audio = sr.Recognizer().record(source)
+        if suppress:
+            if audio.sample_rate not in suppressors:
+                suppressors[audio.sample_rate] = NoiseSuppressor(
+                    audio.sample_rate)
+            audio = suppressors[audio.sample_rate].process_audio_data(audio)
+        result = recognizer.recognize(audio)
+        if result is None:
+            reask += 1
+        elif expected.lower() in result.transcript.lower():
+            correct += 1
+        logging.info('%s: expected %r, got %r', path, expected,
+                     result and result.transcript)
+    cpu_time = sum(s.cpu_time for s in suppressors.values())
+    audio_time = sum(s.audio_time for s in suppressors.values())
+    return (correct / float(len(fixtures)), reask / float(len(fixtures)),
+            cpu_time / audio_time if audio_time else 0.0)
+
+
+def synthetic_fixture(sample_rate, snr_db, noise='white', seconds=3.0,
+                      seed=0):
+    """Builds a noisy fixture around a speech-like signal.
+
+    The speech stand-in is a harmonic series on a pitch gliding from
+    120Hz to 180Hz, cut into 4Hz syllables between 1s and 2.5s. The first
+    second is noise only, as when listening starts.
+
+    Args:
+      sample_rate: sample rate in hertz.
+      snr_db: speech to noise power ratio over the speech part.
+      noise: 'white' for white noise, 'hum' for white noise plus 50Hz
+        mains hum and its harmonics.
+      seconds: fixture length.
+      seed: random seed of the noise.
+    Returns: (clean, noisy) float32 arrays in full scale.
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(int(seconds * sample_rate)) / float(sample_rate)
+    pitch = 120 + 60 * t / seconds
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    clean = sum(np.sin(k * phase) / k
+                for k in range(1, int(4000 / pitch.max()) + 1))
+    speech = (t >= 1.0) & (t < 2.5)
+    clean *= speech * np.sin(np.pi * 4 * (t - 1.0)) ** 2
+    clean *= 0.1 / np.sqrt(np.mean(clean[speech] ** 2))
+
+    hiss = rng.randn(len(t))
+    if noise == 'hum':
+        hiss += sum(2.0 / k * np.sin(2 * np.pi * 50 * k * t)
+                    for k in range(1, 4))
+    elif noise != 'white':
+        raise ValueError('Unknown noise %r' % noise)
+    hiss *= (np.sqrt(np.mean(clean[speech] ** 2) /
+                     np.mean(hiss[speech] ** 2)) * 10 ** (-snr_db / 20.0))
+    return clean.astype(np.float32), (clean + hiss).astype(np.float32)
+
+
+def si_snr(reference, estimate):
+    """Returns: scale-invariant SNR in dB of estimate against reference,
+      so the AGC gain does not count as distortion.
+    """
+    target = np.dot(estimate, reference) / np.dot(reference, reference)
+    target = target * reference
+    return 10 * np.log10(np.sum(target ** 2) /
+                         (np.sum((estimate - target) ** 2) + 1e-12))
+
+
+def evaluate_synthetic(sample_rate=16000, snrs=SYNTHETIC_SNRS,
+                       noises=SYNTHETIC_NOISES):
+    """Runs the NoiseSuppressor over synthetic fixtures.
+
+    Returns: list of (noise, input SNR, SI-SNR before, SI-SNR after,
+      CPU load) per fixture, SI-SNR measured over the speech part.
+    """
+    results = []
+    speech = slice(sample_rate, int(2.5 * sample_rate))
+    for noise in noises:
+        for snr in snrs:
+            clean, noisy = synthetic_fixture(sample_rate, snr, noise)
+            audio = sr.AudioData(
+                (np.clip(noisy, -1, 1) * 32767).astype('<i2').tobytes(),
+                sample_rate, 2)
+            suppressor = NoiseSuppressor(sample_rate)
+            filtered = np.frombuffer(
+                suppressor.process_audio_data(audio).frame_data,
+                dtype='<i2') / 32768.0
+            results.append((noise, snr,
+                            si_snr(clean[speech], noisy[speech]),
+                            si_snr(clean[speech], filtered[speech]),
+                            suppressor.cpu_load))
+    return results
+
+
+@click.command()
+@click.argument('fixtures_dir', required=False,
+                type=click.Path(exists=True, file_okay=False))
+@click.option('--synthetic', is_flag=True, default=False,
+              help='Measure SI-SNR on synthetic noisy fixtures instead, '
+              'needs no recordings or network access.')
+@click.option('--verbose', '-v', is_flag=True, default=False,
+              help='Verbose logging.')
+def main(fixtures_dir, synthetic, verbose):
+    """Measures hotword accuracy and re-ask rate on noisy WAV fixtures,
+    with and without noise suppression.
+
+    Each <name>.wav fixture needs a <name>.txt file holding the hotword
+    spoken in it.
+    """
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+    if synthetic:
+        for noise, snr, before, after, cpu_load in evaluate_synthetic():
+            click.echo('%s noise at %2d dB: SI-SNR %5.1f dB -> %5.1f dB, '
+                       'CPU load %.2f%%' % (noise, snr, before, after,
+                                            100 * cpu_load))
+        return
+    if fixtures_dir is None:
+        raise click.UsageError('Missing FIXTURES_DIR or --synthetic')
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, '*.wav'))):
+        with open(os.path.splitext(path)[0] + '.txt') as f:
+            fixtures.append((path, f.read().strip()))
+    if not fixtures:
+        raise click.ClickException('No WAV fixtures in %s' % fixtures_dir)
+    recognizer = recognizer_helpers.RacingRecognizer(
+        recognizer_helpers.default_backends(
+            sorted(set(e for _, e in fixtures))))
+    for name, suppress in (('raw', False), ('suppressed', True)):
+        accuracy, reask, cpu_load = evaluate(recognizer, fixtures, suppress)
+        click.echo('%s: accuracy %.0f%%, re-ask rate %.0f%%' %
+                   (name, 100 * accuracy, 100 * reask))
+    click.echo('noise suppression CPU load: %.2f%% (budget %.2f%%)' %
+               (100 * cpu_load, 100 * DEFAULT_CPU_BUDGET))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,7 @@
 """Sample that implements a gRPC client for the Google Assistant API."""
 
 import concurrent.futures
+import itertools
 import json
 import logging
 import os
@@ -33,10 +34,14 @@ import google.auth.transport.requests
 import google.oauth2.credentials
 
 import speech_recognition as sr
-import time
-import RPi.GPIO as GPIO
 import threading
 
+try:
+    import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+    # Not running on a Raspberry Pi, LEDs are disabled.
+    GPIO = None
+
 from google.assistant.embedded.v1alpha2 import (
     embedded_assistant_pb2,
     embedded_assistant_pb2_grpc
@@ -47,12 +52,20 @@ try:
     from . import (
         assistant_helpers,
         audio_helpers,
-        device_helpers
+        audio_tuning_helpers,
+        device_helpers,
+        leak_helpers,
+        recognizer_helpers,
+        simulation_helpers
     )
 except (SystemError, ImportError):
     import assistant_helpers
     import audio_helpers
+    import audio_tuning_helpers
     import device_helpers
+    import leak_helpers
+    import recognizer_helpers
+    import simulation_helpers
 
 
 
@@ -74,11 +87,16 @@ class SampleAssistant(object):
         Google Assistant API.
       deadline_sec: gRPC deadline in seconds for Google Assistant API call.
       device_handler: callback for device actions.
+      on_event: callback(name, *args) for the 'recording_started',
+        'recording_stopped', 'transcript' and 'response_text' events.
+      noise_suppressor: NoiseSuppressor applied to recorded audio
+        before it is sent, or None.
     """
 
     def __init__(self, language_code, device_model_id, device_id,
                  conversation_stream,
-                 channel, deadline_sec, device_handler):
+                 channel, deadline_sec, device_handler, on_event=None,
+                 noise_suppressor=None):
         self.language_code = language_code
         self.device_model_id = device_model_id
         self.device_id = device_id
@@ -99,14 +117,21 @@ class SampleAssistant(object):
         self.deadline = deadline_sec
 
         self.device_handler = device_handler
+        self.on_event = on_event
+        self.noise_suppressor = noise_suppressor
 
     def __enter__(self):
         return self
 
     def __exit__(self, etype, e, traceback):
+        # Also on errors, the sound device must not stay open.
+        self.conversation_stream.close()
         if e:
             return False
-        self.conversation_stream.close()
+
+    def _emit(self, name, *args):
+        if self.on_event:
+            self.on_event(name, *args)
 
     def is_grpc_error_unavailable(e):
         is_grpc_error = isinstance(e, grpc.RpcError)
@@ -123,14 +148,10 @@ class SampleAssistant(object):
         """
         continue_conversation = False
         device_actions_futures = []
-        global dimstart
-        global pin_num
-        
-        dimstart = 1 #Start dimming LED to signal ready status
+
         self.conversation_stream.start_recording()
         logging.info('Recording audio request.')
-        t1 = threading.Thread(target=leddim,args=(5,)) #Dim second pin
-        t1.start()
+        self._emit('recording_started') #Start dimming LED to signal ready status
 
         def iter_assist_requests():
             for c in self.gen_assist_requests():
@@ -146,15 +167,20 @@ class SampleAssistant(object):
             if resp.event_type == END_OF_UTTERANCE:
                 logging.info('End of audio request detected')
                 self.conversation_stream.stop_recording()
-                dimstart = 0 #Stop dimming
+                self._emit('recording_stopped') #Stop dimming
 		#speech text
             if resp.speech_results:
+                transcript = ' '.join(r.transcript
+                                      for r in resp.speech_results)
                 logging.info('Transcript of user request: "%s".',
-                             ' '.join(r.transcript
-                                      for r in resp.speech_results))
+                             transcript)
+                self._emit('transcript', transcript)
                 logging.info('Playing assistant response.')
 		#Possible text from google
                 print(resp.dialog_state_out.supplemental_display_text)
+            if resp.dialog_state_out.supplemental_display_text:
+                self._emit('response_text',
+                           resp.dialog_state_out.supplemental_display_text)
             if len(resp.audio_out.audio_data) > 0:
                 self.conversation_stream.write(resp.audio_out.audio_data)
             if resp.dialog_state_out.conversation_state:
@@ -193,9 +219,8 @@ class SampleAssistant(object):
 
     def gen_assist_requests(self):
         """Yields: AssistRequest messages to send to the API."""
-        #language_code=self.language_code
         dialog_state_in = embedded_assistant_pb2.DialogStateIn(
-                language_code=new_lang,
+                language_code=self.language_code,
                 conversation_state=b''
             )
         if self.conversation_state:
@@ -220,7 +245,11 @@ class SampleAssistant(object):
         # The first AssistRequest must contain the AssistConfig
         # and no audio data.
         yield embedded_assistant_pb2.AssistRequest(config=config)
+        if self.noise_suppressor:
+            self.noise_suppressor.reset()
         for data in self.conversation_stream:
+            if self.noise_suppressor:
+                data = self.noise_suppressor.process(data)
             # Subsequent requests need audio data, but not config.
             yield embedded_assistant_pb2.AssistRequest(audio_in=data)
 
@@ -262,6 +291,8 @@ class SampleTextAssistant(object):
 
     def __exit__(self, etype, e, traceback):
         if e:
+            # assist() closes the stream only when it succeeds.
+            self.conversation_stream.close()
             return False
 
     def assist(self, text_query):
@@ -320,6 +351,513 @@ class SampleTextAssistant(object):
         return display_text
 
 
+#Hotword, language code, text query used to greet in the new language
+#and LED pin lit for the language (None when the language has no LED).
+LANGUAGES = [
+    ('German', 'de-DE', 'Say yes bot imation in german', 3), #Pins 3 and 5
+    ('Spanish', 'es-ES', 'Say hello bot imation in spanish', 7), #Pins 7,8
+    ('Spanish neutral', 'es-419', 'Say hello bot imation in spanish', 7),
+    ('French Canada', 'fr-CA', 'Say yes bot imation in french', None),
+    ('French', 'fr-FR', 'Say yes bot imation in french', 10), #Pins 10,12
+    ('Japanese', 'ja-JP', 'Say good morning bot mation in japanese', 11), #Pins 11,13
+    ('Korean', 'ko-KR', 'Say good evening bot mation in korean', 15), #Pins 15, 16
+    ('Italian', 'it-IT', 'Say how can I help you in italian', 18), #Pins 18, 19
+    ('English', 'en-US', 'repeat after me Botmation ready', 21), #Pins 21, 22
+    ('Australian', 'en-AU', 'how do you say Botmation ready in en-AU', None),
+    ('British', 'en-GB', 'How do you say Botmation ready in Britan', None),
+    ('Canadian', 'en-CA', 'how do you say Botmation ready in Canada', None),
+    ('Portuguese', 'pt-BR', 'Say hello in Portuguese', 23), #Pins 23, 24
+]
+LED_PINS = [3, 5, 7, 8, 10, 11, 12, 13, 15, 16, 18, 19, 21, 22, 23, 24]
+DIM_PIN = 5 #Dimmed while the assistant is listening
+HOTWORD_SAMPLE_RATE = 48000 #May need to increase sample rate if recognition is having issues
+ENERGY_THRESHOLD = 400 #Higher value better for loud areas
+HOTWORD_LISTEN_TIMEOUT = 5 #Seconds of silence before stop() is checked again
+HOTWORD_PHRASE_LIMIT = 10 #Longest hotword phrase in seconds
+TURN_ERROR_DELAY = 1 #Seconds to wait after a failed turn
+
+
+def match_language(phrase):
+    """Returns: the LANGUAGES entry of the longest hotword in phrase,
+      or None if the phrase names no language.
+    """
+    matches = [l for l in LANGUAGES if l[0] in phrase]
+    if not matches:
+        return None
+    return max(matches, key=lambda l: len(l[0]))
+
+
+class NullLedBackend(object):
+    """LED backend used when no GPIO is available."""
+
+    def setup(self):
+        pass
+
+    def show_language(self, pin):
+        pass
+
+    def start_dimming(self):
+        pass
+
+    def stop_dimming(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+class GpioLedBackend(object):
+    """LEDs wired to the Raspberry Pi GPIO header, set up on first use.
+
+    Args:
+      pins: board pin numbers of all LEDs.
+      dim_pin: pin dimmed while the assistant is listening.
+      gpio: RPi.GPIO module or a stand-in with the same interface.
+    """
+
+    def __init__(self, pins=LED_PINS, dim_pin=DIM_PIN, gpio=None):
+        self.pins = pins
+        self.dim_pin = dim_pin
+        self.gpio = gpio or GPIO
+        self._stop_dimming = threading.Event()
+        self._dim_thread = None
+        self._ready = False
+
+    def setup(self):
+        if self._ready:
+            return
+        self.gpio.setmode(self.gpio.BOARD)
+        self.gpio.setup(self.pins, self.gpio.OUT)
+        self._ready = True
+
+    def show_language(self, pin):
+        self.setup()
+        self.gpio.output(self.pins, 0)
+        if pin is not None:
+            self.gpio.output(pin, 1)
+
+    def start_dimming(self):
+        if self._dim_thread:
+            return
+        self.setup()
+        self._stop_dimming.clear()
+        self._dim_thread = threading.Thread(target=self._dim)
+        self._dim_thread.daemon = True
+        self._dim_thread.start()
+
+    def stop_dimming(self):
+        if not self._dim_thread:
+            return
+        self._stop_dimming.set()
+        self._dim_thread.join()
+        self._dim_thread = None
+
+    def _dim(self):
+        p = self.gpio.PWM(self.dim_pin, 50)  # frequency=50Hz
+        p.start(0) #Enter 0-100 for brightness level start value
+        steps = list(range(0, 101, 5)) + list(range(100, -1, -5))
+        for dc in itertools.cycle(steps):
+            p.ChangeDutyCycle(dc)
+            if self._stop_dimming.wait(0.1):
+                break
+        p.stop()
+
+    def cleanup(self):
+        if not self._ready:
+            return
+        self.stop_dimming()
+        self.gpio.cleanup()
+        self._ready = False
+
+
+class AssistantEngine(object):
+    """Multi language Assistant switched by spoken hotwords.
+
+    The engine owns the gRPC channel, the audio pipeline, the language
+    state and the LED backend, and keeps them warm between turns.
+    Each turn listens for a hotword, switches language when the phrase
+    names one, greets in it and then holds a voice conversation.
+
+    Callbacks registered with on() receive the 'hotword',
+    'language_changed', 'conversation_started', 'conversation_finished',
+    'recording_started', 'recording_stopped', 'transcript',
+    'response_text' and 'error' events. A turn that fails, e.g. on a
+    gRPC error left after retries, is logged and reported as an 'error'
+    event, and the loop goes on with the next turn.
+
+    Args:
+      channel: authorized gRPC channel for connection to the
+        Google Assistant API.
+      device_model_id: identifier of the device model.
+      device_id: identifier of the registered device instance.
+      language_code: initial language for the conversation.
+      deadline_sec: gRPC deadline in seconds for Google Assistant API call.
+      device_handler: callback for device actions.
+      input_audio_file: path of a WAV file used instead of audio capture.
+      output_audio_file: path of a WAV file used instead of audio playback.
+      audio_sample_rate: audio sample rate in hertz.
+      audio_sample_width: audio sample width in bytes.
+      audio_iter_size: size of each read during audio stream iteration.
+      audio_block_size: block size in bytes of audio device operations.
+      audio_flush_size: size of silence data written during flush.
+      audio_tuner: AutoTuner overriding block and iter sizes, or None.
+      audio_device_factory: callable(block_size) returning the audio
+        device stream, defaults to a MonitoredSoundDeviceStream.
+      noise_suppression: filter noise out of hotword and request audio.
+      recognizer: RacingRecognizer used for hotwords, defaults to the
+        cloud backend plus the local keyword spotter when available.
+      leds: LED backend, defaults to GPIO LEDs when available.
+      listen: callable returning the speech_recognition.AudioData of the
+        next hotword, defaults to listening on the microphone. It may
+        raise speech_recognition.WaitTimeoutError when nothing was said.
+    """
+
+    def __init__(self, channel, device_model_id, device_id,
+                 language_code='en-US',
+                 deadline_sec=DEFAULT_GRPC_DEADLINE, device_handler=None,
+                 input_audio_file=None, output_audio_file=None,
+                 audio_sample_rate=audio_helpers.DEFAULT_AUDIO_SAMPLE_RATE,
+                 audio_sample_width=audio_helpers.DEFAULT_AUDIO_SAMPLE_WIDTH,
+                 audio_iter_size=audio_helpers.DEFAULT_AUDIO_ITER_SIZE,
+                 audio_block_size=audio_helpers.DEFAULT_AUDIO_DEVICE_BLOCK_SIZE,
+                 audio_flush_size=audio_helpers.DEFAULT_AUDIO_DEVICE_FLUSH_SIZE,
+                 audio_tuner=None, audio_device_factory=None,
+                 noise_suppression=False,
+                 recognizer=None, leds=None, listen=None):
+        self.channel = channel
+        self.device_model_id = device_model_id
+        self.device_id = device_id
+        self.language_code = language_code
+        self.deadline = deadline_sec
+        self.device_handler = (device_handler or
+                               device_helpers.DeviceRequestHandler(device_id))
+        self.input_audio_file = input_audio_file
+        self.output_audio_file = output_audio_file
+        self.audio_sample_rate = audio_sample_rate
+        self.audio_sample_width = audio_sample_width
+        self.audio_iter_size = audio_iter_size
+        self.audio_block_size = audio_block_size
+        self.audio_flush_size = audio_flush_size
+        self.audio_tuner = audio_tuner
+        self.audio_device_factory = (audio_device_factory or
+                                     self._sound_device_stream)
+        # Noise profiles are kept warm between turns.
+        self.hotword_suppressor = self.request_suppressor = None
+        if noise_suppression:
+            # Imported here, NumPy is only needed for noise suppression.
+            try:
+                from . import noise_helpers
+            except (SystemError, ImportError):
+                import noise_helpers
+            self.hotword_suppressor = noise_helpers.NoiseSuppressor(
+                HOTWORD_SAMPLE_RATE)
+            self.request_suppressor = noise_helpers.NoiseSuppressor(
+                audio_sample_rate)
+        self.recognizer = recognizer or recognizer_helpers.RacingRecognizer(
+            recognizer_helpers.default_backends([l[0] for l in LANGUAGES]))
+        if leds is None:
+            leds = GpioLedBackend() if GPIO else NullLedBackend()
+        self.leds = leds
+        self.listen = listen
+        if listen is None:
+            # Kept between turns, so the dynamic energy threshold is too.
+            self._hotword_recognizer = sr.Recognizer()
+            self._hotword_recognizer.energy_threshold = ENERGY_THRESHOLD
+            self.listen = self._listen_microphone
+
+        self.audio_device = None
+        self._callbacks = {}
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._waiting = False
+
+    def on(self, name, callback):
+        """Registers callback(*args) for the named event."""
+        self._callbacks.setdefault(name, []).append(callback)
+
+    def _emit(self, name, *args):
+        if name == 'recording_started':
+            self.leds.start_dimming()
+        elif name == 'recording_stopped':
+            self.leds.stop_dimming()
+        for callback in self._callbacks.get(name, []):
+            try:
+                callback(*args)
+            except Exception as e:
+                logging.error('Error in %s callback: %s', name, e)
+
+    def start(self, once=False):
+        """Runs the hotword loop in a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        # Cleared here, not in the thread, so an early stop() holds.
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, args=(once,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the hotword loop after the current turn.
+
+        An idle loop stops within HOTWORD_LISTEN_TIMEOUT seconds.
+        """
+        self._stopping.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def close(self):
+        """Stops the hotword loop and releases the LEDs."""
+        self.stop()
+        self.leds.cleanup()
+
+    def run(self, once=False):
+        """Runs the hotword loop until stop() is called.
+
+        Args:
+          once: stop after the first conversation.
+        """
+        self._stopping.clear()
+        self._run(once)
+
+    def _run(self, once):
+        self.leds.setup()
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if self.run_turn() and once:
+                        break
+                except Exception as e:
+                    logging.exception('Turn failed: %s', e)
+                    self._emit('error', e)
+                    self._stopping.wait(TURN_ERROR_DELAY)
+        finally:
+            self.leds.cleanup()
+
+    def run_turn(self):
+        """Listens for a hotword and holds the conversation it starts.
+
+        Returns: True if a conversation was held.
+        """
+        if not self._waiting:
+            print('Say something!')
+        try:
+            audio = self.listen()
+        except sr.WaitTimeoutError:
+            # Nothing said, give stop() a chance.
+            self._waiting = True
+            return False
+        self._waiting = False
+        print('Processing')
+        if self.hotword_suppressor:
+            audio = self.hotword_suppressor.process_audio_data(audio)
+        result = self.recognizer.recognize(audio)
+        logging.debug('Hotword recognizer stats:\n%s',
+                      self.recognizer.format_stats())
+        if result is None:
+            print('Speech recognition could not understand audio')
+            return False
+        print('Speech recognition (' + result.backend + ') thinks you said ' +
+              result.transcript)
+        self._emit('hotword', result.transcript)
+        language = match_language(result.transcript)
+        if language:
+            self.switch_language(language)
+        self.converse()
+        return True
+
+    def switch_language(self, language):
+        """Switches to a LANGUAGES entry and greets in it."""
+        hotword, language_code, greeting, pin = language
+        print('Switching to ' + hotword)
+        self.language_code = language_code
+        self.leds.show_language(pin)
+        self._emit('language_changed', language_code)
+        print('Sending text to Assistant')
+        display_text = self.submit_text(greeting)
+        click.echo('<@assistant> %s' % display_text)
+
+    def submit_text(self, text_query):
+        """Sends a text query and plays back the spoken response.
+
+        Returns: the supplemental display text of the response.
+        """
+        with self._lock:
+            with SampleTextAssistant(self.language_code,
+                                     self.device_model_id, self.device_id,
+                                     self._conversation_stream(),
+                                     self.channel, self.deadline,
+                                     self.device_handler) as textassistant:
+                display_text = textassistant.assist(text_query=text_query)
+        if display_text:
+            self._emit('response_text', display_text)
+        return display_text
+
+    def converse(self):
+        """Holds a voice conversation until no follow-on is expected."""
+        with self._lock:
+            self._emit('conversation_started')
+            with SampleAssistant(self.language_code, self.device_model_id,
+                                 self.device_id, self._conversation_stream(),
+                                 self.channel, self.deadline,
+                                 self.device_handler,
+                                 on_event=self._emit,
+                                 noise_suppressor=self.request_suppressor
+                                 ) as assistant:
+                try:
+                    continue_conversation = True
+                    while continue_conversation:
+                        continue_conversation = assistant.assist()
+                        self._log_audio_device()
+                        # If file arguments are supplied:
+                        # exit after the first turn of the conversation.
+                        if self.input_audio_file or self.output_audio_file:
+                            break
+                finally:
+                    self.leds.stop_dimming()
+            self._emit('conversation_finished')
+
+    def _log_audio_device(self):
+        if not self.audio_device:
+            return
+        logging.info('Audio device stats: %s', self.audio_device.stats)
+        if self.request_suppressor:
+            logging.info('Noise suppression CPU load: %.2f%%',
+                         100 * self.request_suppressor.cpu_load)
+        if self.audio_tuner:
+            self.audio_tuner.observe(self.audio_device.stats)
+        self.audio_device.stats.reset()
+
+    def _listen_microphone(self):
+        # The microphone stays open across timeouts and is released
+        # once a phrase is heard, for the conversation audio device.
+        with sr.Microphone(sample_rate=HOTWORD_SAMPLE_RATE) as source:
+            while True:
+                try:
+                    return self._hotword_recognizer.listen(
+                        source, timeout=HOTWORD_LISTEN_TIMEOUT,
+                        phrase_time_limit=HOTWORD_PHRASE_LIMIT)
+                except sr.WaitTimeoutError:
+                    if self._stopping.is_set():
+                        raise
+
+    def _sound_device_stream(self, block_size):
+        return audio_tuning_helpers.MonitoredSoundDeviceStream(
+            sample_rate=self.audio_sample_rate,
+            sample_width=self.audio_sample_width,
+            block_size=block_size,
+            flush_size=self.audio_flush_size
+        )
+
+    def _conversation_stream(self):
+        """Returns: a new ConversationStream, the audio device has to be
+          released after each conversation for hotword listening.
+        """
+        block_size = self.audio_block_size
+        iter_size = self.audio_iter_size
+        if self.audio_tuner:
+            block_size = self.audio_tuner.profile.block_size
+            iter_size = self.audio_tuner.profile.iter_size
+
+        # Configure audio source and sink.
+        audio_device = None
+        if self.input_audio_file:
+            audio_source = audio_helpers.WaveSource(
+                open(self.input_audio_file, 'rb'),
+                sample_rate=self.audio_sample_rate,
+                sample_width=self.audio_sample_width
+            )
+        else:
+            audio_source = audio_device = (
+                audio_device or self.audio_device_factory(block_size)
+            )
+        if self.output_audio_file:
+            audio_sink = audio_helpers.WaveSink(
+                open(self.output_audio_file, 'wb'),
+                sample_rate=self.audio_sample_rate,
+                sample_width=self.audio_sample_width
+            )
+        else:
+            audio_sink = audio_device = (
+                audio_device or self.audio_device_factory(block_size)
+            )
+        self.audio_device = audio_device
+
+        # Create conversation stream with the given audio source and sink.
+        return audio_helpers.ConversationStream(
+            source=audio_source,
+            sink=audio_sink,
+            iter_size=iter_size,
+            sample_width=self.audio_sample_width,
+        )
+
+
+def connect(api_endpoint, credentials, project_id,
+            device_model_id, device_id, device_config):
+    """Loads credentials and registers the device if needed.
+
+    Returns: (authorized gRPC channel, device model id, device id).
+    """
+    # Load OAuth 2.0 credentials.
+    try:
+        with open(credentials, 'r') as f:
+            credentials = google.oauth2.credentials.Credentials(token=None,
+                                                                **json.load(f))
+            http_request = google.auth.transport.requests.Request()
+            credentials.refresh(http_request)
+    except Exception as e:
+        logging.error('Error loading credentials: %s', e)
+        logging.error('Run google-oauthlib-tool to initialize '
+                      'new OAuth 2.0 credentials.')
+        sys.exit(-1)
+
+    # Create an authorized gRPC channel.
+    grpc_channel = google.auth.transport.grpc.secure_authorized_channel(
+        credentials, http_request, api_endpoint)
+    logging.info('Connecting to %s', api_endpoint)
+
+    if not device_id or not device_model_id:
+        try:
+            with open(device_config) as f:
+                device = json.load(f)
+                device_id = device['id']
+                device_model_id = device['model_id']
+        except Exception as e:
+            logging.warning('Device config not found: %s' % e)
+            logging.info('Registering device')
+            if not device_model_id:
+                logging.error('Option --device-model-id required '
+                              'when registering a device instance.')
+                sys.exit(-1)
+            if not project_id:
+                logging.error('Option --project-id required '
+                              'when registering a device instance.')
+                sys.exit(-1)
+            device_base_url = (
+                'https://%s/v1alpha2/projects/%s/devices' % (api_endpoint,
+                                                             project_id)
+            )
+            device_id = str(uuid.uuid1())
+            payload = {
+                'id': device_id,
+                'model_id': device_model_id,
+                'client_type': 'SDK_SERVICE'
+            }
+            session = google.auth.transport.requests.AuthorizedSession(
+                credentials
+            )
+            r = session.post(device_base_url, data=json.dumps(payload))
+            if r.status_code != 200:
+                logging.error('Failed to register device: %s', r.text)
+                sys.exit(-1)
+            logging.info('Device registered: %s', device_id)
+            os.makedirs(os.path.dirname(device_config), exist_ok=True)
+            with open(device_config, 'w') as f:
+                json.dump(payload, f)
+
+    return grpc_channel, device_model_id, device_id
+
+
 @click.command()
 @click.option('--api-endpoint', default=ASSISTANT_API_ENDPOINT,
               metavar='<api endpoint>', show_default=True,
@@ -385,18 +923,44 @@ class SampleTextAssistant(object):
               metavar='<audio flush size>', show_default=True,
               help=('Size of silence data in bytes written '
                     'during flush operation'))
+@click.option('--audio-auto-tune', default=False, is_flag=True,
+              help=('Search the lowest latency block and iter sizes '
+                    'without xruns for the audio device, overrides '
+                    '--audio-block-size and --audio-iter-size.'))
+@click.option('--audio-profiles', show_default=True,
+              metavar='<audio profiles>',
+              default=os.path.join(
+                  click.get_app_dir('googlesamples-assistant'),
+                  'audio_profiles.json'),
+              help='Path to save and restore tuned audio device profiles')
+@click.option('--noise-suppression', default=False, is_flag=True,
+              help=('Filter noise out of the audio before hotword '
+                    'recognition and before sending it to the Assistant.'))
+@click.option('--leak-check', default=0,
+              metavar='<turns>', show_default=True,
+              help=('Snapshot memory, threads, file descriptors and audio '
+                    'handles every <turns> conversations, 0 disables.'))
+@click.option('--leak-report', show_default=True,
+              metavar='<leak report>', default='leak_report.txt',
+              help='Path to write the leak check report.')
+@click.option('--simulate', default=False, is_flag=True,
+              help=('Run against scripted fake audio, hotwords and '
+                    'Assistant server, without hardware or network.'))
+@click.option('--simulate-turns', default=1000,
+              metavar='<turns>', show_default=True,
+              help='Conversations held before a simulated run stops.')
 @click.option('--grpc-deadline', default=DEFAULT_GRPC_DEADLINE,
               metavar='<grpc deadline>', show_default=True,
               help='gRPC deadline in seconds')
 @click.option('--once', default=False, is_flag=True,
               help='Force termination after a single conversation.')
-
-
 def main(api_endpoint, credentials, project_id,
          device_model_id, device_id, device_config, lang, verbose,
          input_audio_file, output_audio_file,
          audio_sample_rate, audio_sample_width,
          audio_iter_size, audio_block_size, audio_flush_size,
+         audio_auto_tune, audio_profiles, noise_suppression,
+         leak_check, leak_report, simulate, simulate_turns,
          grpc_deadline, once, *args, **kwargs):
     """Samples for the Google Assistant API.
     Examples:
@@ -407,74 +971,23 @@ def main(api_endpoint, credentials, project_id,
       Run the sample with file input and output:
         $ python -m googlesamples.assistant -i <input file> -o <output file>
     """
-    global run_once
-    global switchover
-    
-    
-    if run_once:
-        print("running main code")
-        run_once = 1
-        # Setup logging.
-        logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
-
-        # Load OAuth 2.0 credentials.
-        try:
-            with open(credentials, 'r') as f:
-                credentials = google.oauth2.credentials.Credentials(token=None,
-                                                                **json.load(f))
-                http_request = google.auth.transport.requests.Request()
-                credentials.refresh(http_request)
-        except Exception as e:
-            logging.error('Error loading credentials: %s', e)
-            logging.error('Run google-oauthlib-tool to initialize '
-                          'new OAuth 2.0 credentials.')
-            sys.exit(-1)
-
-        # Create an authorized gRPC channel.
-        grpc_channel = google.auth.transport.grpc.secure_authorized_channel(
-            credentials, http_request, api_endpoint)
-        logging.info('Connecting to %s', api_endpoint)
-    
-    # Configure audio source and sink.
-    audio_device = None
-    if input_audio_file:
-        audio_source = audio_helpers.WaveSource(
-            open(input_audio_file, 'rb'),
-            sample_rate=audio_sample_rate,
-            sample_width=audio_sample_width
-        )
-    else:
-        audio_source = audio_device = (
-            audio_device or audio_helpers.SoundDeviceStream(
-                sample_rate=audio_sample_rate,
-                sample_width=audio_sample_width,
-                block_size=audio_block_size,
-                flush_size=audio_flush_size
-            )
-        )
-    if output_audio_file:
-        audio_sink = audio_helpers.WaveSink(
-            open(output_audio_file, 'wb'),
-            sample_rate=audio_sample_rate,
-            sample_width=audio_sample_width
-        )
+    # Setup logging.
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+
+    if leak_check and (input_audio_file or output_audio_file):
+        logging.error('Option --leak-check needs the hotword loop, '
+                      'it cannot be used with audio file arguments.')
+        sys.exit(-1)
+
+    if simulate:
+        # Scripted fake audio and Assistant server, no network access.
+        grpc_channel = simulation_helpers.FakeAssistantChannel()
+        device_model_id = device_model_id or 'simulated-model'
+        device_id = device_id or 'simulated-device'
     else:
-        audio_sink = audio_device = (
-            audio_device or audio_helpers.SoundDeviceStream(
-                sample_rate=audio_sample_rate,
-                sample_width=audio_sample_width,
-                block_size=audio_block_size,
-                flush_size=audio_flush_size
-            )
-        )
-
-    # Create conversation stream with the given audio source and sink.
-    conversation_stream = audio_helpers.ConversationStream(
-        source=audio_source,
-        sink=audio_sink,
-        iter_size=audio_iter_size,
-        sample_width=audio_sample_width,
-    )
+        grpc_channel, device_model_id, device_id = connect(
+            api_endpoint, credentials, project_id,
+            device_model_id, device_id, device_config)
 
     device_handler = device_helpers.DeviceRequestHandler(device_id)
 
@@ -485,274 +998,102 @@ def main(api_endpoint, credentials, project_id,
         else:
             logging.info('Turning device off')
 
-    if not device_id or not device_model_id:
+    if simulate:
+        audio_device_name = 'simulated'
+        audio_device_factory = (
+            lambda block_size: audio_tuning_helpers.SimulatedSoundDeviceStream(
+                sample_rate=audio_sample_rate,
+                sample_width=audio_sample_width,
+                block_size=block_size,
+                flush_size=audio_flush_size
+            ))
+        simulated = dict(
+            recognizer=simulation_helpers.scripted_recognizer(
+                [l[0] for l in LANGUAGES] + ['hello', None]),
+            leds=GpioLedBackend(gpio=simulation_helpers.FakeGPIO()),
+            listen=simulation_helpers.silent_listener(HOTWORD_SAMPLE_RATE))
+    else:
+        audio_device_name = None
+        audio_device_factory = (
+            lambda block_size: audio_tuning_helpers.MonitoredSoundDeviceStream(
+                sample_rate=audio_sample_rate,
+                sample_width=audio_sample_width,
+                block_size=block_size,
+                flush_size=audio_flush_size
+            ))
+        simulated = {}
+
+    # Tune audio block sizes once, the device is reopened every turn.
+    audio_tuner = None
+    if audio_auto_tune and not (input_audio_file and output_audio_file):
+        audio_tuner = audio_tuning_helpers.AutoTuner(
+            audio_device_factory,
+            audio_sample_rate, audio_sample_width,
+            store=audio_tuning_helpers.ProfileStore(audio_profiles),
+            device_name=(audio_device_name or
+                         audio_tuning_helpers.default_device_name()))
+        audio_tuner.load_or_tune()
+
+    engine = AssistantEngine(grpc_channel, device_model_id, device_id,
+                             language_code=lang,
+                             deadline_sec=grpc_deadline,
+                             device_handler=device_handler,
+                             input_audio_file=input_audio_file,
+                             output_audio_file=output_audio_file,
+                             audio_sample_rate=audio_sample_rate,
+                             audio_sample_width=audio_sample_width,
+                             audio_iter_size=audio_iter_size,
+                             audio_block_size=audio_block_size,
+                             audio_flush_size=audio_flush_size,
+                             audio_tuner=audio_tuner,
+                             audio_device_factory=audio_device_factory,
+                             noise_suppression=noise_suppression,
+                             **simulated)
+
+    # If file arguments are supplied:
+    # hold a single conversation without waiting for a hotword.
+    if input_audio_file or output_audio_file:
         try:
-            with open(device_config) as f:
-                device = json.load(f)
-                device_id = device['id']
-                device_model_id = device['model_id']
-        except Exception as e:
-            logging.warning('Device config not found: %s' % e)
-            logging.info('Registering device')
-            if not device_model_id:
-                logging.error('Option --device-model-id required '
-                              'when registering a device instance.')
-                sys.exit(-1)
-            if not project_id:
-                logging.error('Option --project-id required '
-                              'when registering a device instance.')
-                sys.exit(-1)
-            device_base_url = (
-                'https://%s/v1alpha2/projects/%s/devices' % (api_endpoint,
-                                                             project_id)
-            )
-            device_id = str(uuid.uuid1())
-            payload = {
-                'id': device_id,
-                'model_id': device_model_id,
-                'client_type': 'SDK_SERVICE'
-            }
-            session = google.auth.transport.requests.AuthorizedSession(
-                credentials
-            )
-            r = session.post(device_base_url, data=json.dumps(payload))
-            if r.status_code != 200:
-                logging.error('Failed to register device: %s', r.text)
-                sys.exit(-1)
-            logging.info('Device registered: %s', device_id)
-            os.makedirs(os.path.dirname(device_config), exist_ok=True)
-            with open(device_config, 'w') as f:
-                json.dump(payload, f)
-
-#Text input
-    print("Playing custom text audio")
-    #During initial hotword we will need to custom play audio through text assistant.
-    if switchover:
-        print("part 1")
-        #Set switchover to 0 so startup audio google assistant.
-        switchover = 0
-        with SampleTextAssistant(lang, device_model_id, device_id,conversation_stream,
-                             grpc_channel, grpc_deadline,device_handler) as textassistant:
-            #while True:
-            #text_query = click.prompt('')
-            #click.echo('<you> %s' % text_query)
-            text_query = utext_query
-            display_text = textassistant.assist(text_query=text_query)
-            click.echo('<@assistant> %s' % display_text)
-            main2()
-                    
-    else:    
-        
-        switchover = 1
-        print("part 2")
-        with SampleAssistant(lang, device_model_id, device_id,
-                             conversation_stream,
-                             grpc_channel, grpc_deadline,
-                             device_handler) as assistant:
-        # If file arguments are supplied:
-        # exit after the first turn of the conversation.
-            if input_audio_file or output_audio_file:
-                assistant.assist()
-                return
-
-        # If no file arguments supplied:
-        # keep recording voice requests using the microphone
-        # and playing back assistant response using the speaker.
-        # When the once flag is set, don't wait for a trigger. Otherwise, wait.
-            wait_for_user_trigger = not once
-        #wait_for_user_trigger = once
-            while True:
-                #if wait_for_user_trigger:
-                #    click.pause(info='Press Enter to send a new request...')
-                continue_conversation = assistant.assist()
-                # wait for user trigger if there is no follow-up turn in
-                # the conversation.
-                wait_for_user_trigger = not continue_conversation
-                if wait_for_user_trigger:
-                    
-                    speech()
-                # If we only want one conversation, break.
-                if once and (not continue_conversation):
-                    
-                    break
-
-
-def main2():
+            engine.converse()
+        finally:
+            engine.close()
+        return
+
+    # If no file arguments supplied:
+    # keep listening for hotwords using the microphone
+    # and hold a conversation after each of them.
+    # When the once flag is set, stop after the first conversation.
+    leak_checker = None
+    if leak_check:
+        types = [audio_helpers.ConversationStream,
+                 audio_helpers.SoundDeviceStream,
+                 audio_tuning_helpers.SimulatedSoundDeviceStream,
+                 device_helpers.DeviceRequestHandler,
+                 SampleAssistant, SampleTextAssistant]
+        if not simulate:
+            # Hotword audio handles, opened for every hotword.
+            pyaudio = sr.Microphone.get_pyaudio()
+            # PyAudio 0.2.13 moved Stream into PyAudio.
+            types += [sr.Microphone, sr.Microphone.MicrophoneStream,
+                      pyaudio.PyAudio,
+                      getattr(pyaudio.PyAudio, 'Stream', pyaudio.Stream)]
+        leak_checker = leak_helpers.LeakChecker(leak_check, leak_report,
+                                                types=types)
+        leak_checker.start()
+        engine.on('conversation_finished', leak_checker.turn)
+    if simulate:
+        turns = itertools.count(1)
+
+        def stop_simulation():
+            if next(turns) >= simulate_turns:
+                engine.stop()
+        engine.on('conversation_finished', stop_simulation)
+    try:
+        engine.run(once=once)
+    finally:
+        if leak_checker:
+            leak_checker.stop()
+
+
+if __name__ == '__main__':
     main()
-
-#sample_rate = 48000 #May need to increase sample rate if recognition is having issues
-def speech():
-
-        global utext_query
-        global new_lang
-        global switchover
-        global dimstart
-        global pin_num
-        r = sr.Recognizer()
-        chan_list = [3,5,7,8,10,11,12,13,15,16,18,19,21,22,23,24]
-        GPIO.setup(chan_list, GPIO.OUT)
-        
-        with sr.Microphone(sample_rate = 48000) as source:
-            print("Say something!")
-            audio = r.listen(source)
-
-            myphrase = "blank"
-            # recognize speech using Google Speech Recognition
-            try:# for testing purposes, we're just using the default API key
-		# to use another API key, use `r.recognize_google(audio, key="GOOGLE_SPEECH_RECOGNITION_API_KEY")`
-		# instead of `r.recognize_google(audio)`
-                print("Processing")
-                myphrase = r.recognize_google(audio)
-                myquery = myphrase
-                print("Google Speech Recognition thinks you said " + r.recognize_google(audio))
-            except sr.UnknownValueError:
-                print("Google Speech Recognition could not understand audio")
-                return
-            except sr.RequestError as e:
-                print("Could not request results from Google Speech Recognition service; {0}".format(e))
-
-        GPIO.output(chan_list, 0)
-        if 'German' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to German')
-            
-            utext_query = "Say yes bot imation in german"
-            switchover = 1
-            new_lang = 'de-DE'
-            GPIO.output(3, 1) #Pins 3 and 5
-            pin_num = 5 #Dim second pin number assignment
-            main()
-        if 'Spanish' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Spanish')
-            utext_query = "Say hello bot imation in spanish"
-            switchover = 1
-            new_lang = 'es-ES'
-            GPIO.output(7, 1) #Pins 7,8
-            main()
-        if 'Spanish neutral' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Spanish neutral')
-            utext_query = "Say hello bot imation in spanish"
-            switchover = 1
-            new_lang = 'es-419'
-            GPIO.output(7, 1)
-            main()
-        if 'French Canada' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to French canada')
-            utext_query = "Say yes bot imation in french"
-            switchover = 1
-            new_lang = 'fr-CA'
-            main()
-        if 'French' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to French')
-            utext_query = "Say yes bot imation in french"
-            switchover = 1
-            new_lang = 'fr-FR'
-            GPIO.output(10, 1)#Pins 10,12
-            main()
-
-        if 'Japanese' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Japanese')
-            utext_query = "Say good morning bot mation in japanese"
-            switchover = 1
-            new_lang = 'ja-JP'
-            GPIO.output(11, 1)#Pins 11,13
-            main()
-        if 'Korean' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to korean')
-            utext_query = "Say good evening bot mation in korean"
-            switchover = 1
-            new_lang = 'ko-KR'
-            GPIO.output(15, 1)#Pins 15, 16
-            main()
-        if 'Italian' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to italian')
-            utext_query = "Say how can I help you in italian"
-            switchover = 1
-            new_lang = 'it-IT'
-            GPIO.output(18, 1) #Pins 18, 19
-            main()
-        if 'English' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to English')
-            utext_query = "repeat after me Botmation ready"
-            switchover = 1
-            new_lang = 'en-US'
-            GPIO.output(21, 1) #Pins 21, 22
-            main()  
-        if 'Australian' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Australian')
-            utext_query = "how do you say Botmation ready in en-AU"
-            switchover = 1
-            new_lang = 'en-AU'
-            main()		
-        if 'British' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to British')
-            utext_query = "How do you say Botmation ready in Britan"
-            switchover = 1
-            new_lang = 'en-GB'
-            main()
-        if 'Canadian' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Canadian')
-            utext_query = "how do you say Botmation ready in Canada"
-            switchover = 1
-            new_lang = 'en-CA'
-            main()
-        if 'Portuguese' in myphrase:
-            print('Sending text to Assistant')
-            print('Switching to Portuguese')
-            utext_query = "Say hello in Portuguese"
-            switchover = 1
-            new_lang = 'pt-BR'
-            GPIO.output(23, 1) #Pins 23, 24
-            main()		
-        GPIO.cleanup()
-        dimstart = 0
-
-#thread.start_new_thread(someFunc, ())
-#This will dim the associated LED to signal when to speak to google.
-def leddim(pin):
-
-
-	GPIO.setup(pin, GPIO.OUT)
-	global dimstart 
-
-	p = GPIO.PWM(pin, 50)  # channel=12 frequency=50Hz
-	p.start(0) #Enter 0-100 for brightness level start value
-
-	while dimstart:
-		for dc in range(0, 101, 5): #range([start], stop[, step])
-			p.ChangeDutyCycle(dc)
-			time.sleep(0.1)
-			print('Dim level' + str(dc))
-		for dc in range(100, -1, -5):
-			p.ChangeDutyCycle(dc)
-			time.sleep(0.1)
-
-	p.stop()
-	
-#Initial startup variable
-run_once = 1
-new_lang = 'en-US'
-skip = 1 #1 to run speech
-sr.energy_threshold = 400 #Higher value better for loud areas
-utext_query = 'default' #used for sending queries to google
-switchover = 1 #used to initiate hello in new language
-dimstart = False #used to control dimming of LEDs
-GPIO.setmode(GPIO.BOARD)
-
-#if __name__ == '__main__':
-while True:
-    print('starting point')
-    speech()
-    main()
-
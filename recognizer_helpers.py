@@ -0,0 +1,312 @@
+#Botmation Terms of use
+#This code is for personal entertainment use only.
+#This code is not to be used commercially.
+
+"""Pluggable speech recognizer backends for the hotword stage."""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+
+import speech_recognition as sr
+
+
+DEFAULT_RECOGNIZER_TIMEOUT = 5.0
+DEFAULT_MIN_CONFIDENCE = 0.5
+
+
+RecognitionResult = collections.namedtuple(
+    'RecognitionResult', ['transcript', 'confidence', 'backend'])
+
+
+class Recognizer(object):
+    """Base class for a hotword recognizer backend.
+
+    Args:
+      name: name used in logs and stats.
+      timeout: seconds after which the race gives up on this backend.
+    """
+
+    def __init__(self, name, timeout=DEFAULT_RECOGNIZER_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+
+    def recognize(self, audio):
+        """Recognize the given speech_recognition.AudioData.
+
+        Returns: RecognitionResult, or None if nothing was understood.
+        Raises: speech_recognition.RequestError if the backend failed.
+        """
+        raise NotImplementedError()
+
+
+class GoogleRecognizer(Recognizer):
+    """Google Web Speech API backend.
+
+    Args:
+      key: API key, if missing the default speech_recognition key is used.
+      language: language code of the recognition.
+      default_confidence: confidence assumed when the API omits it.
+    """
+
+    def __init__(self, key=None, language='en-US', default_confidence=0.75,
+                 timeout=DEFAULT_RECOGNIZER_TIMEOUT, name='google'):
+        super(GoogleRecognizer, self).__init__(name, timeout)
+        self.key = key
+        self.language = language
+        self.default_confidence = default_confidence
+        self._recognizer = sr.Recognizer()
+        self._recognizer.operation_timeout = timeout
+
+    def recognize(self, audio):
+        try:
+            response = self._recognizer.recognize_google(
+                audio, key=self.key, language=self.language, show_all=True)
+        except sr.UnknownValueError:
+            return None
+        if not response or not response.get('alternative'):
+            return None
+        best = response['alternative'][0]
+        return RecognitionResult(best['transcript'],
+                                 best.get('confidence',
+                                          self.default_confidence),
+                                 self.name)
+
+
+class SphinxKeywordRecognizer(Recognizer):
+    """Local CMU Sphinx keyword spotter, works without network access.
+
+    The reported confidence is the posterior probability pocketsphinx
+    gives the hypothesis.
+
+    Args:
+      keywords: phrases to spot, returned with their original casing.
+      sensitivity: keyword sensitivity from 0 (fewer false alarms) to
+        1 (fewer misses), as taken by speech_recognition.
+    """
+
+    def __init__(self, keywords, sensitivity=0.8,
+                 timeout=DEFAULT_RECOGNIZER_TIMEOUT, name='sphinx'):
+        super(SphinxKeywordRecognizer, self).__init__(name, timeout)
+        self.keywords = dict((k.lower(), k) for k in keywords)
+        self.sensitivity = sensitivity
+        self._recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        try:
+            decoder = self._recognizer.recognize_sphinx(
+                audio,
+                keyword_entries=[(k, self.sensitivity)
+                                 for k in self.keywords],
+                show_all=True)
+        except sr.UnknownValueError:
+            return None
+        hypothesis = decoder.hyp()
+        if hypothesis is None:
+            return None
+        spotted = [self.keywords[k] for k in self.keywords
+                   if k in hypothesis.hypstr.lower()]
+        if not spotted:
+            return None
+        return RecognitionResult(' '.join(spotted), hypothesis.prob,
+                                 self.name)
+
+
+class StaticRecognizer(Recognizer):
+    """Local stand-in that replays scripted transcripts.
+
+    Args:
+      phrases: transcripts returned in turn, None means not understood.
+      confidence: confidence reported for every transcript.
+      delay: seconds to sleep before answering, to simulate latency.
+    """
+
+    def __init__(self, phrases, confidence=1.0, delay=0,
+                 timeout=DEFAULT_RECOGNIZER_TIMEOUT, name='static'):
+        super(StaticRecognizer, self).__init__(name, timeout)
+        self.phrases = list(phrases)
+        self.confidence = confidence
+        self.delay = delay
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def recognize(self, audio):
+        if self.delay:
+            time.sleep(self.delay)
+        with self._lock:
+            phrase = self.phrases[self._index % len(self.phrases)]
+            self._index += 1
+        if phrase is None:
+            return None
+        return RecognitionResult(phrase, self.confidence, self.name)
+
+
+class BackendStats(object):
+    """Latency and win-rate counters of a single backend."""
+
+    def __init__(self):
+        self.calls = 0
+        self.wins = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.skipped = 0
+        self.completed = 0
+        self.total_latency = 0.0
+
+    @property
+    def mean_latency(self):
+        if not self.completed:
+            return 0.0
+        return self.total_latency / self.completed
+
+    @property
+    def win_rate(self):
+        if not self.calls:
+            return 0.0
+        return self.wins / float(self.calls)
+
+
+class RacingRecognizer(object):
+    """Races several recognizer backends on the same audio.
+
+    Every call of a backend runs in its own daemon thread. The first
+    result at or above min_confidence wins; backends that are still
+    running are abandoned and their late results are discarded.
+    A backend still busy with an earlier call is skipped, so a hung
+    backend never holds up the others.
+
+    Args:
+      backends: list of Recognizer instances with distinct names.
+      min_confidence: lowest confidence accepted as a winner.
+    """
+
+    def __init__(self, backends, min_confidence=DEFAULT_MIN_CONFIDENCE):
+        self.backends = list(backends)
+        names = [b.name for b in self.backends]
+        duplicates = sorted(set(n for n in names if names.count(n) > 1))
+        if duplicates:
+            raise ValueError('Duplicate recognizer names: %s' %
+                             ', '.join(duplicates))
+        self.min_confidence = min_confidence
+        self.stats = collections.OrderedDict(
+            (b.name, BackendStats()) for b in self.backends)
+        self._lock = threading.Lock()
+        self._busy = set()
+
+    def _run(self, backend, audio):
+        start = time.monotonic()
+        try:
+            result = backend.recognize(audio)
+        except sr.RequestError as e:
+            logging.warning('Recognizer %s request failed: %s',
+                            backend.name, e)
+            with self._lock:
+                self.stats[backend.name].errors += 1
+            return None
+        except Exception as e:
+            logging.error('Recognizer %s failed: %s', backend.name, e)
+            with self._lock:
+                self.stats[backend.name].errors += 1
+            return None
+        finally:
+            with self._lock:
+                self._busy.discard(backend.name)
+        with self._lock:
+            stats = self.stats[backend.name]
+            stats.completed += 1
+            stats.total_latency += time.monotonic() - start
+        return result
+
+    def _start(self, backend, audio):
+        """Returns: Future of the backend result, None if still busy."""
+        with self._lock:
+            if backend.name in self._busy:
+                self.stats[backend.name].skipped += 1
+                return None
+            self._busy.add(backend.name)
+            self.stats[backend.name].calls += 1
+        f = concurrent.futures.Future()
+        f.set_running_or_notify_cancel()
+        thread = threading.Thread(
+            target=lambda: f.set_result(self._run(backend, audio)),
+            name='recognizer-%s' % backend.name)
+        thread.daemon = True
+        thread.start()
+        return f
+
+    def recognize(self, audio):
+        """Recognize the given speech_recognition.AudioData.
+
+        Returns: the winning RecognitionResult, or None if no backend
+          answered above the confidence threshold in time.
+        """
+        start = time.monotonic()
+        pending = {}
+        for backend in self.backends:
+            f = self._start(backend, audio)
+            if f is None:
+                logging.debug('Recognizer %s still busy, skipped',
+                              backend.name)
+                continue
+            pending[f] = backend
+
+        winner = None
+        while pending and winner is None:
+            now = time.monotonic()
+            for f, backend in list(pending.items()):
+                if now - start >= backend.timeout and not f.done():
+                    logging.warning('Recognizer %s timed out after %.1fs',
+                                    backend.name, backend.timeout)
+                    with self._lock:
+                        self.stats[backend.name].timeouts += 1
+                    del pending[f]
+            if not pending:
+                break
+            timeout = min(start + b.timeout for b in pending.values()) - now
+            done, _ = concurrent.futures.wait(
+                pending, timeout=max(timeout, 0),
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                backend = pending.pop(f)
+                result = f.result()
+                if result is None:
+                    continue
+                if result.confidence < self.min_confidence:
+                    logging.debug('Recognizer %s below threshold: %s (%.2f)',
+                                  backend.name, result.transcript,
+                                  result.confidence)
+                    continue
+                if winner is None:
+                    winner, winner_backend = result, backend
+
+        if winner is not None:
+            with self._lock:
+                self.stats[winner_backend.name].wins += 1
+        return winner
+
+    def format_stats(self):
+        """Returns: one line of latency/win-rate stats per backend."""
+        with self._lock:
+            return '\n'.join(
+                '%s: calls=%d wins=%d (%.0f%%) errors=%d timeouts=%d '
+                'skipped=%d mean latency=%.3fs' % (
+                    name, s.calls, s.wins, 100 * s.win_rate, s.errors,
+                    s.timeouts, s.skipped, s.mean_latency)
+                for name, s in self.stats.items())
+
+
+def default_backends(keywords, timeout=DEFAULT_RECOGNIZER_TIMEOUT):
+    """Returns: the cloud backend, plus the local keyword spotter
+      when pocketsphinx is installed.
+    """
+    backends = [GoogleRecognizer(timeout=timeout)]
+    try:
+        import pocketsphinx  # noqa: F401
+    except ImportError:
+        logging.info('pocketsphinx not installed, '
+                     'skipping local keyword spotter')
+    else:
+        backends.append(SphinxKeywordRecognizer(keywords, timeout=timeout))
+    return backends
@@ -0,0 +1,143 @@
+#Botmation Terms of use
+#This code is for personal entertainment use only.
+#This code is not to be used commercially.
+
+"""Scripted fake audio, GPIO and Assistant server for running without
+hardware or network access, as fast as the host allows."""
+
+import itertools
+import threading
+
+import speech_recognition as sr
+
+from google.assistant.embedded.v1alpha2 import embedded_assistant_pb2
+
+try:
+    from . import recognizer_helpers
+except (SystemError, ImportError):
+    import recognizer_helpers
+
+
+END_OF_UTTERANCE = embedded_assistant_pb2.AssistResponse.END_OF_UTTERANCE
+DIALOG_FOLLOW_ON = embedded_assistant_pb2.DialogStateOut.DIALOG_FOLLOW_ON
+CLOSE_MICROPHONE = embedded_assistant_pb2.DialogStateOut.CLOSE_MICROPHONE
+
+
+class FakeAssistantChannel(object):
+    """gRPC channel stand-in answering Assist calls with scripted responses.
+
+    Voice requests are answered after utterance_chunks audio requests,
+    text requests right away. Every follow_on_every-th voice request
+    expects a follow-on turn.
+
+    Args:
+      transcripts: transcripts of the voice requests, used in turn.
+      utterance_chunks: audio requests read before END_OF_UTTERANCE.
+      response_chunks: audio responses played back per request.
+      chunk_size: size in bytes of each audio response.
+      follow_on_every: voice requests per follow-on turn, 0 for none.
+    """
+
+    def __init__(self, transcripts=('what time is it',), utterance_chunks=10,
+                 response_chunks=10, chunk_size=3200, follow_on_every=0):
+        self._transcripts = itertools.cycle(transcripts)
+        self.utterance_chunks = utterance_chunks
+        self.response_chunks = response_chunks
+        self.chunk_size = chunk_size
+        self.follow_on_every = follow_on_every
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def stream_stream(self, method, request_serializer=None,
+                      response_deserializer=None):
+        return self._assist
+
+    def _assist(self, requests, timeout=None):
+        requests = iter(requests)
+        config = next(requests).config
+        with self._lock:
+            self.requests += 1
+            transcript = config.text_query or next(self._transcripts)
+            follow_on = (not config.text_query and self.follow_on_every and
+                         self.requests % self.follow_on_every == 0)
+        if not config.text_query:
+            for _ in range(self.utterance_chunks):
+                if next(requests, None) is None:
+                    break
+            yield embedded_assistant_pb2.AssistResponse(
+                event_type=END_OF_UTTERANCE)
+        # Draining the requests starts the playback.
+        for _ in requests:
+            pass
+        yield embedded_assistant_pb2.AssistResponse(
+            speech_results=[embedded_assistant_pb2.SpeechRecognitionResult(
+                transcript=transcript, stability=1.0)],
+            dialog_state_out=embedded_assistant_pb2.DialogStateOut(
+                supplemental_display_text=transcript,
+                conversation_state=b'simulated',
+                microphone_mode=(DIALOG_FOLLOW_ON if follow_on
+                                 else CLOSE_MICROPHONE)))
+        for _ in range(self.response_chunks):
+            yield embedded_assistant_pb2.AssistResponse(
+                audio_out=embedded_assistant_pb2.AudioOut(
+                    audio_data=b'\x00' * self.chunk_size))
+
+
+class FakePWM(object):
+    """RPi.GPIO.PWM stand-in."""
+
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+
+    def start(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+
+    def stop(self):
+        pass
+
+
+class FakeGPIO(object):
+    """RPi.GPIO module stand-in keeping the pin levels in memory."""
+
+    BOARD = 'BOARD'
+    OUT = 'OUT'
+    PWM = FakePWM
+
+    def __init__(self):
+        self.levels = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pins, mode):
+        pass
+
+    def output(self, pins, level):
+        if not isinstance(pins, (list, tuple)):
+            pins = [pins]
+        for pin in pins:
+            self.levels[pin] = level
+
+    def cleanup(self):
+        self.levels.clear()
+
+
+def silent_listener(sample_rate, seconds=1.0):
+    """Returns: callable returning seconds of silent hotword audio."""
+    frame_data = b'\x00' * int(2 * sample_rate * seconds)
+
+    def listen():
+        return sr.AudioData(frame_data, sample_rate, 2)
+    return listen
+
+
+def scripted_recognizer(phrases):
+    """Returns: RacingRecognizer replaying phrases, None is not understood.
+    """
+    return recognizer_helpers.RacingRecognizer(
+        [recognizer_helpers.StaticRecognizer(phrases)])